@@ -10,7 +10,9 @@ from telegram.ext import (
     filters
 )
 import os
-import json
+import html
+import orjson
+import time
 
 # إعدادات التسجيل
 logging.basicConfig(
@@ -26,28 +28,94 @@ user_sessions = {}
 
 # ملف لتخزين البيانات
 DATA_FILE = "bot_data.json"
+# سجل إضافي لتحديثات الجلسات بين اللقطات
+SESSIONS_LOG = "bot_sessions.log"
+# عدد التحديثات قبل كتابة لقطة كاملة جديدة
+SNAPSHOT_EVERY = 100
+
+sessions_log = None
+pending_updates = 0
 
 def save_data():
+    """كتابة لقطة كاملة ثم تفريغ سجل الجلسات"""
+    global sessions_log, pending_updates
     data = {
         'owner_id': owner_id,
         'owner_username': owner_username,
         'user_sessions': user_sessions
     }
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f)
+    # الكتابة في ملف مؤقت ثم استبداله، حتى لا تبقى لقطة غير مكتملة
+    tmp_file = DATA_FILE + '.tmp'
+    # مفاتيح user_sessions أرقام، لذلك نحتاج OPT_NON_STR_KEYS
+    with open(tmp_file, 'wb') as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
+    os.replace(tmp_file, DATA_FILE)
+    
+    # اللقطة تحتوي على كل شيء الآن، لذلك يبدأ السجل من جديد
+    # ويُفتح مرة أخرى عند أول إضافة فقط في save_session
+    if sessions_log is not None:
+        sessions_log.close()
+        sessions_log = None
+    open(SESSIONS_LOG, 'wb').close()
+    pending_updates = 0
+
+def save_session(user_id):
+    """إضافة سطر واحد إلى السجل بدلاً من إعادة كتابة الملف كاملاً"""
+    global sessions_log, pending_updates
+    if sessions_log is None:
+        sessions_log = open(SESSIONS_LOG, 'ab')
+    
+    entry = {'user_id': user_id, 'ts': time.time(), **user_sessions[user_id]}
+    sessions_log.write(orjson.dumps(entry) + b'\n')
+    sessions_log.flush()
+    
+    pending_updates += 1
+    if pending_updates >= SNAPSHOT_EVERY:
+        save_data()
 
 def load_data():
     global owner_id, owner_username, user_sessions
     try:
-        with open(DATA_FILE, 'r') as f:
-            data = json.load(f)
+        with open(DATA_FILE, 'rb') as f:
+            data = orjson.loads(f.read())
             owner_id = data.get('owner_id')
             owner_username = data.get('owner_username')
-            user_sessions = data.get('user_sessions', {})
+            # مفاتيح JSON نصية دائماً، بينما نستخدم user.id كرقم
+            user_sessions = {int(k): v for k, v in data.get('user_sessions', {}).items()}
     except FileNotFoundError:
         owner_id = None
         owner_username = None
         user_sessions = {}
+    
+    # إعادة تطبيق التحديثات المسجلة بعد آخر لقطة
+    try:
+        with open(SESSIONS_LOG, 'rb') as f:
+            for line in f:
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # سطر غير مكتمل في حال توقف البوت أثناء الكتابة
+                    continue
+                user_sessions[entry['user_id']] = {
+                    'message_id': entry['message_id'],
+                    'owner_message_id': entry['owner_message_id']
+                }
+    except FileNotFoundError:
+        return
+    
+    # دمج السجل في لقطة جديدة حتى تبدأ الإضافات التالية على سطر نظيف
+    save_data()
+
+# قوالب الرسائل الثابتة، تُبنى مرة واحدة ويُملأ فيها الجزء المتغير فقط
+# تُرسل بصيغة HTML لأن Markdown لا يمكنه تهريب الاسم داخل رابط الـ mention
+NEW_MESSAGE_TEMPLATE = (
+    "📨 رسالة جديدة من {mention}\n"
+    "🆔 ID: <code>{user_id}</code>\n"
+    "📛 الاسم: {full_name}\n\n"
+    "💬 الرسالة:\n{text}"
+)
+PHOTO_CAPTION_TEMPLATE = "📸 صورة من {mention}"
+DOCUMENT_CAPTION_TEMPLATE = "📄 ملف من {mention}"
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global owner_id, owner_username
@@ -106,18 +174,21 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             sent_message = await context.bot.send_message(
                 chat_id=owner_id,
-                text=f"📨 رسالة جديدة من {user.mention_markdown()}\n"
-                     f"🆔 ID: `{user.id}`\n"
-                     f"📛 الاسم: {user.full_name}\n\n"
-                     f"💬 الرسالة:\n{message.text}",
-                parse_mode='Markdown'
+                text=NEW_MESSAGE_TEMPLATE.format(
+                    mention=user.mention_html(),
+                    user_id=user.id,
+                    # نص المستخدم قد يحتوي على رموز HTML
+                    full_name=html.escape(user.full_name),
+                    text=html.escape(message.text)
+                ),
+                parse_mode='HTML'
             )
             
             user_sessions[user.id] = {
                 'message_id': message.message_id,
                 'owner_message_id': sent_message.message_id
             }
-            save_data()
+            save_session(user.id)
             
             await message.reply_text("✅ تم إرسال رسالتك إلى المالك")
             
@@ -138,39 +209,38 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             await query.edit_message_text("⚠️ لم يتم تعيين مالك بعد!")
 
-async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تحويل الصور والملفات إلى المالك عبر handler واحد"""
     user = update.effective_user
+    message = update.message
     if user.id == owner_id:
         return
     
     if owner_id:
-        try:
-            await context.bot.send_photo(
+        if message.photo:
+            send = context.bot.send_photo(
                 chat_id=owner_id,
-                photo=update.message.photo[-1].file_id,
-                caption=f"📸 صورة من {user.mention_markdown()}",
-                parse_mode='Markdown'
+                photo=message.photo[-1].file_id,
+                caption=PHOTO_CAPTION_TEMPLATE.format(mention=user.mention_html()),
+                parse_mode='HTML'
             )
-            await update.message.reply_text("✅ تم إرسال الصورة إلى المالك")
-        except Exception as e:
-            await update.message.reply_text("❌ حدث خطأ في إرسال الصورة")
-
-async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    if user.id == owner_id:
-        return
-    
-    if owner_id:
-        try:
-            await context.bot.send_document(
+            success_text = "✅ تم إرسال الصورة إلى المالك"
+            error_text = "❌ حدث خطأ في إرسال الصورة"
+        else:
+            send = context.bot.send_document(
                 chat_id=owner_id,
-                document=update.message.document.file_id,
-                caption=f"📄 ملف من {user.mention_markdown()}",
-                parse_mode='Markdown'
+                document=message.document.file_id,
+                caption=DOCUMENT_CAPTION_TEMPLATE.format(mention=user.mention_html()),
+                parse_mode='HTML'
             )
-            await update.message.reply_text("✅ تم إرسال الملف إلى المالك")
+            success_text = "✅ تم إرسال الملف إلى المالك"
+            error_text = "❌ حدث خطأ في إرسال الملف"
+        
+        try:
+            await send
+            await message.reply_text(success_text)
         except Exception as e:
-            await update.message.reply_text("❌ حدث خطأ في إرسال الملف")
+            await message.reply_text(error_text)
 
 def run_bot():
     """تشغيل البوت في event loop منفصل"""
@@ -189,8 +259,7 @@ def run_bot():
         application.add_handler(CommandHandler("start", start))
         application.add_handler(CallbackQueryHandler(button_handler))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-        application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-        application.add_handler(MessageHandler(filters.DOCUMENT, handle_document))
+        application.add_handler(MessageHandler(filters.PHOTO | filters.DOCUMENT, handle_media))
         
         print("🤖 بوت التواصل يعمل...")
         if owner_id:
@@ -203,6 +272,8 @@ def run_bot():
     except Exception as e:
         print(f"❌ خطأ في تشغيل البوت: {e}")
     finally:
+        # حفظ لقطة كاملة عند الإيقاف
+        save_data()
         loop.close()
 
 if __name__ == '__main__':